@@ -7,13 +7,36 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import base64
+import binascii
+import hashlib
+import hmac
 import json
+import os
+import ssl
+import tempfile
+import threading
+import time
 import traceback
 
 from ansible.module_utils.urls import open_url
+from ansible.module_utils.six import BytesIO
 from ansible.module_utils.six.moves.urllib.parse import urlencode, quote
 from ansible.module_utils.six.moves.urllib.error import HTTPError
-from ansible.module_utils.common.text.converters import to_native, to_text
+from ansible.module_utils.common.text.converters import to_bytes, to_native, to_text
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 URL_REALM_INFO = "{url}/realms/{realm}"
 URL_REALMS = "{url}/admin/realms"
@@ -36,7 +59,9 @@ URL_CLIENTTEMPLATES = "{url}/admin/realms/{realm}/client-templates"
 URL_GROUPS = "{url}/admin/realms/{realm}/groups"
 URL_GROUP = "{url}/admin/realms/{realm}/groups/{groupid}"
 URL_USERS = "{url}/admin/realms/{realm}/users"
+URL_USERS_COUNT = "{url}/admin/realms/{realm}/users/count"
 URL_USER = "{url}/admin/realms/{realm}/users/{userid}"
+URL_USER_RESET_PASSWORD = "{url}/admin/realms/{realm}/users/{userid}/reset-password"
 
 URL_CLIENTSCOPES = "{url}/admin/realms/{realm}/client-scopes"
 URL_CLIENTSCOPE = "{url}/admin/realms/{realm}/client-scopes/{id}"
@@ -66,6 +91,47 @@ URL_IDENTITY_PROVIDER_MAPPER = "{url}/admin/realms/{realm}/identity-provider/ins
 URL_COMPONENTS = "{url}/admin/realms/{realm}/components"
 URL_COMPONENT = "{url}/admin/realms/{realm}/components/{id}"
 
+CACHE_DIR = "~/.ansible/tmp"
+TOKEN_CACHE_MIN_TTL = 30
+
+USERS_PAGE_SIZE = 1000
+
+SESSION_POOL_CONNECTIONS = 4
+SESSION_POOL_MAXSIZE = 16
+
+
+def _json_dumps(obj):
+    """ Serializes a request body, with orjson when it is available
+        :param obj: object to serialize
+        :return: JSON document, as bytes with orjson and as str otherwise
+    """
+    if HAS_ORJSON:
+        try:
+            # json converts non-string keys to strings as well
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # for instance integers beyond 64 bits, which json supports
+            pass
+    return json.dumps(obj)
+
+
+def _json_loads(document):
+    """ Deserializes a response body, with orjson when it is available
+        :param document: JSON document as str or bytes
+        :return: deserialized object
+    """
+    if HAS_ORJSON:
+        return orjson.loads(document)
+    return json.loads(document)
+
+
+def _json_load(response):
+    """ Deserializes the body of a response object
+        :param response: file-like object, for instance a HTTPResponse
+        :return: deserialized object
+    """
+    return _json_loads(response.read())
+
 
 def keycloak_argument_spec():
     """
@@ -87,8 +153,15 @@ def keycloak_argument_spec():
     )
 
 
+_camel_cache = {}
+
+
 def camel(words):
-    return words.split('_')[0] + ''.join(x.capitalize() or '_' for x in words.split('_')[1:])
+    try:
+        return _camel_cache[words]
+    except KeyError:
+        result = _camel_cache[words] = words.split('_')[0] + ''.join(x.capitalize() or '_' for x in words.split('_')[1:])
+        return result
 
 
 class KeycloakError(Exception):
@@ -129,9 +202,9 @@ def get_token(module_params):
         payload = dict(
             (k, v) for k, v in temp_payload.items() if v is not None)
         try:
-            r = json.loads(to_native(open_url(auth_url, method='POST',
-                                              validate_certs=validate_certs, http_agent=http_agent, timeout=connection_timeout,
-                                              data=urlencode(payload)).read()))
+            r = _json_loads(to_native(open_url(auth_url, method='POST',
+                                               validate_certs=validate_certs, http_agent=http_agent, timeout=connection_timeout,
+                                               data=urlencode(payload)).read()))
         except ValueError as e:
             raise KeycloakError(
                 'API returned invalid JSON when trying to obtain access token from %s: %s'
@@ -151,6 +224,90 @@ def get_token(module_params):
     }
 
 
+def _token_expiry(token):
+    """ Extracts the expiry timestamp (exp claim) from a JWT access token
+        :param token: access token as returned by Keycloak
+        :return: expiry as seconds since the epoch or None if it cannot be determined
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(to_text(base64.urlsafe_b64decode(payload)))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _write_cache_file(cache_file, obj):
+    """ Atomically writes obj as JSON to a file only readable by the current user.
+        The caches are a best effort, failing to write them is silently ignored.
+        :param cache_file: path of the file to write
+        :param obj: object to write
+    """
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix='.keycloak_')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        pass
+
+
+def _password_check(password, salt):
+    """ Computes a salted keyed hash of a password, to detect a changed password without storing it
+        :param password: password, None if there is none
+        :param salt: salt, as a hexadecimal string
+        :return: check value as a hexadecimal string
+    """
+    return hmac.new(binascii.unhexlify(salt), to_bytes(password or '', errors='surrogate_or_strict'), hashlib.sha256).hexdigest()
+
+
+def get_cached_token(module_params, cache_dir=CACHE_DIR):
+    """ Obtains connection header like get_token(), but reuses an access token obtained
+        by a previous invocation with the same credentials until it is about to expire
+        :param module_params: parameters of the module
+        :param cache_dir: directory in which access tokens are cached
+        :return: connection header
+    """
+    if module_params.get('token') is not None:
+        return get_token(module_params)
+
+    # The password is not part of the file name, a token obtained with another password is detected
+    # through a check value stored in the file
+    cache_key = '|'.join(to_text(module_params.get(k))
+                         for k in ('auth_keycloak_url', 'auth_realm', 'auth_client_id', 'auth_username'))
+    cache_dir = os.path.expanduser(cache_dir)
+    cache_file = os.path.join(cache_dir, 'keycloak_token_%s.json' % hashlib.sha256(cache_key.encode('utf-8')).hexdigest())
+    password = module_params.get('auth_password')
+
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        token = cached['access_token']
+        expiry = _token_expiry(token)
+        if (hmac.compare_digest(_password_check(password, cached['salt']), to_native(cached['check']))
+                and expiry is not None and expiry - time.time() > TOKEN_CACHE_MIN_TTL):
+            return {
+                'Authorization': 'Bearer ' + token,
+                'Content-Type': 'application/json'
+            }
+        # expired, or obtained with another password
+        os.remove(cache_file)
+    except (IOError, OSError, KeyError, TypeError, ValueError):
+        pass
+
+    connection_header = get_token(module_params)
+    token = connection_header['Authorization'][len('Bearer '):]
+    if _token_expiry(token) is None:
+        return connection_header
+
+    salt = to_native(binascii.hexlify(os.urandom(16)))
+    _write_cache_file(cache_file, {'access_token': token, 'salt': salt, 'check': _password_check(password, salt)})
+    return connection_header
+
+
 def is_struct_included(struct1, struct2, exclude=None):
     """
     This function compare if the first parameter structure is included in the second.
@@ -204,6 +361,19 @@ def is_struct_included(struct1, struct2, exclude=None):
         return to_text(struct1, 'utf-8') == to_text(struct2, 'utf-8')
 
 
+class SessionResponse(object):
+    """ Wraps a requests response in the subset of the HTTPResponse interface returned by open_url
+    """
+    def __init__(self, response):
+        self.response = response
+
+    def read(self):
+        return self.response.content
+
+    def getheader(self, name, default=None):
+        return self.response.headers.get(name, default)
+
+
 class KeycloakAPI(object):
     """ Keycloak API access; Keycloak uses OAuth 2.0 to protect its API, an access token for which
         is obtained through OpenID connect
@@ -215,6 +385,63 @@ class KeycloakAPI(object):
         self.connection_timeout = self.module.params.get('connection_timeout')
         self.restheaders = connection_header
         self.http_agent = self.module.params.get('http_agent')
+        # user name to user ID mappings, per realm
+        self._user_index = {}
+        # reverse user ID to user name mappings of the indexed realms, to update the index in constant time
+        self._user_names = {}
+        self._user_index_lock = threading.Lock()
+        # requests sessions are not guaranteed to be thread-safe, every thread gets its own
+        self._sessions = threading.local()
+
+    def _get_session(self):
+        """ Return the requests session of the current thread, None if requests is not available.
+
+        Like open_url, the session verifies certificates against the system trust store. None is
+        also returned when the location of that store is not known.
+        """
+        if not HAS_REQUESTS:
+            return None
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            # requests verifies certificates against its own CA bundle, open_url against the system trust store
+            verify = False
+            if self.validate_certs:
+                paths = ssl.get_default_verify_paths()
+                verify = paths.cafile or paths.capath
+                if not verify:
+                    return None
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SESSION_POOL_CONNECTIONS, pool_maxsize=SESSION_POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.verify = verify
+            session.headers.update(self.restheaders)
+            session.headers.update({'Connection': 'keep-alive', 'User-Agent': self.http_agent})
+            self._sessions.session = session
+        return session
+
+    def _request(self, url, method, data=None):
+        """ Send a request to the Keycloak API.
+
+        When the requests library is available, the request is sent through a session (one per
+        thread) which keeps the connections to Keycloak alive between requests, otherwise through
+        open_url.
+        Either way, HTTP error statuses raise HTTPError.
+
+        :param url: URL to request
+        :param method: HTTP method
+        :param data: request body
+        :return: HTTPResponse like object
+        """
+        session = self._get_session()
+        if session is None:
+            return open_url(url, method=method, http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                            data=data, validate_certs=self.validate_certs)
+
+        response = session.request(method, url, data=data, timeout=self.connection_timeout)
+        if response.status_code >= 300:
+            raise HTTPError(url, response.status_code, response.reason, response.headers, BytesIO(response.content))
+        return SessionResponse(response)
 
     def get_realm_info_by_id(self, realm='master'):
         """ Obtain realm public info by id
@@ -225,9 +452,9 @@ class KeycloakAPI(object):
         realm_info_url = URL_REALM_INFO.format(url=self.baseurl, realm=realm)
 
         try:
-            return json.loads(to_native(open_url(realm_info_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(realm_info_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -251,8 +478,8 @@ class KeycloakAPI(object):
         realm_url = URL_REALM.format(url=self.baseurl, realm=realm)
 
         try:
-            return json.loads(to_native(open_url(realm_url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(realm_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout, validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -277,7 +504,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(realm_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(realmrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(realmrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update realm %s: %s' % (realm, str(e)),
                                   exception=traceback.format_exc())
@@ -291,7 +518,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(realm_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(realmrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(realmrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create realm %s: %s' % (realmrep['id'], str(e)),
                                   exception=traceback.format_exc())
@@ -323,9 +550,9 @@ class KeycloakAPI(object):
             clientlist_url += '?clientId=%s' % filter
 
         try:
-            return json.loads(to_native(open_url(clientlist_url, http_agent=self.http_agent, method='GET', headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(clientlist_url, http_agent=self.http_agent, method='GET', headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of clients for realm %s: %s'
                                       % (realm, str(e)))
@@ -355,9 +582,9 @@ class KeycloakAPI(object):
         client_url = URL_CLIENT.format(url=self.baseurl, realm=realm, id=id)
 
         try:
-            return json.loads(to_native(open_url(client_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(client_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -396,7 +623,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(client_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clientrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clientrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update client %s in realm %s: %s'
                                       % (id, realm, str(e)))
@@ -411,7 +638,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(client_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clientrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clientrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create client %s in realm %s: %s'
                                       % (clientrep['clientId'], realm, str(e)))
@@ -441,9 +668,9 @@ class KeycloakAPI(object):
         """
         client_roles_url = URL_CLIENT_ROLES.format(url=self.baseurl, realm=realm, id=cid)
         try:
-            return json.loads(to_native(open_url(client_roles_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(client_roles_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch rolemappings for client %s in realm %s: %s"
                                       % (cid, realm, str(e)))
@@ -474,9 +701,9 @@ class KeycloakAPI(object):
         """
         rolemappings_url = URL_CLIENT_ROLEMAPPINGS.format(url=self.baseurl, realm=realm, id=gid, client=cid)
         try:
-            rolemappings = json.loads(to_native(open_url(rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                         timeout=self.connection_timeout,
-                                                         validate_certs=self.validate_certs).read()))
+            rolemappings = _json_loads(to_native(open_url(rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                          timeout=self.connection_timeout,
+                                                          validate_certs=self.validate_certs).read()))
             for role in rolemappings:
                 if rid == role['id']:
                     return role
@@ -495,9 +722,9 @@ class KeycloakAPI(object):
         """
         available_rolemappings_url = URL_CLIENT_ROLEMAPPINGS_AVAILABLE.format(url=self.baseurl, realm=realm, id=gid, client=cid)
         try:
-            return json.loads(to_native(open_url(available_rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(available_rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch available rolemappings for client %s in group %s, realm %s: %s"
                                       % (cid, gid, realm, str(e)))
@@ -512,9 +739,9 @@ class KeycloakAPI(object):
         """
         available_rolemappings_url = URL_CLIENT_ROLEMAPPINGS_COMPOSITE.format(url=self.baseurl, realm=realm, id=gid, client=cid)
         try:
-            return json.loads(to_native(open_url(available_rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(available_rolemappings_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch available rolemappings for client %s in group %s, realm %s: %s"
                                       % (cid, gid, realm, str(e)))
@@ -530,7 +757,7 @@ class KeycloakAPI(object):
         """
         available_rolemappings_url = URL_CLIENT_ROLEMAPPINGS.format(url=self.baseurl, realm=realm, id=gid, client=cid)
         try:
-            open_url(available_rolemappings_url, method="POST", http_agent=self.http_agent, headers=self.restheaders, data=json.dumps(role_rep),
+            open_url(available_rolemappings_url, method="POST", http_agent=self.http_agent, headers=self.restheaders, data=_json_dumps(role_rep),
                      validate_certs=self.validate_certs, timeout=self.connection_timeout)
         except Exception as e:
             self.module.fail_json(msg="Could not fetch available rolemappings for client %s in group %s, realm %s: %s"
@@ -562,8 +789,8 @@ class KeycloakAPI(object):
         url = URL_CLIENTTEMPLATES.format(url=self.baseurl, realm=realm)
 
         try:
-            return json.loads(to_native(open_url(url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of client templates for realm %s: %s'
                                       % (realm, str(e)))
@@ -581,8 +808,8 @@ class KeycloakAPI(object):
         url = URL_CLIENTTEMPLATE.format(url=self.baseurl, id=id, realm=realm)
 
         try:
-            return json.loads(to_native(open_url(url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain client templates %s for realm %s: %s'
                                       % (id, realm, str(e)))
@@ -628,7 +855,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clienttrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clienttrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update client template %s in realm %s: %s'
                                       % (id, realm, str(e)))
@@ -643,7 +870,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clienttrep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clienttrep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create client template %s in realm %s: %s'
                                       % (clienttrep['clientId'], realm, str(e)))
@@ -675,9 +902,9 @@ class KeycloakAPI(object):
         """
         clientscopes_url = URL_CLIENTSCOPES.format(url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(clientscopes_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(clientscopes_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch list of clientscopes in realm %s: %s"
                                       % (realm, str(e)))
@@ -693,9 +920,9 @@ class KeycloakAPI(object):
         """
         clientscope_url = URL_CLIENTSCOPE.format(url=self.baseurl, realm=realm, id=cid)
         try:
-            return json.loads(to_native(open_url(clientscope_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(clientscope_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -740,7 +967,7 @@ class KeycloakAPI(object):
         clientscopes_url = URL_CLIENTSCOPES.format(url=self.baseurl, realm=realm)
         try:
             return open_url(clientscopes_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clientscoperep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clientscoperep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg="Could not create clientscope %s in realm %s: %s"
                                       % (clientscoperep['name'], realm, str(e)))
@@ -755,7 +982,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(clientscope_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(clientscoperep), validate_certs=self.validate_certs)
+                            data=_json_dumps(clientscoperep), validate_certs=self.validate_certs)
 
         except Exception as e:
             self.module.fail_json(msg='Could not update clientscope %s in realm %s: %s'
@@ -810,9 +1037,9 @@ class KeycloakAPI(object):
         """
         protocolmappers_url = URL_CLIENTSCOPE_PROTOCOLMAPPERS.format(id=cid, url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(protocolmappers_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(protocolmappers_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch list of protocolmappers in realm %s: %s"
                                       % (realm, str(e)))
@@ -830,9 +1057,9 @@ class KeycloakAPI(object):
         """
         protocolmapper_url = URL_CLIENTSCOPE_PROTOCOLMAPPER.format(url=self.baseurl, realm=realm, id=cid, mapper_id=pid)
         try:
-            return json.loads(to_native(open_url(protocolmapper_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(protocolmapper_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -879,7 +1106,7 @@ class KeycloakAPI(object):
         protocolmappers_url = URL_CLIENTSCOPE_PROTOCOLMAPPERS.format(url=self.baseurl, id=cid, realm=realm)
         try:
             return open_url(protocolmappers_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(mapper_rep), validate_certs=self.validate_certs)
+                            data=_json_dumps(mapper_rep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg="Could not create protocolmapper %s in realm %s: %s"
                                       % (mapper_rep['name'], realm, str(e)))
@@ -895,7 +1122,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(protocolmapper_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(mapper_rep), validate_certs=self.validate_certs)
+                            data=_json_dumps(mapper_rep), validate_certs=self.validate_certs)
 
         except Exception as e:
             self.module.fail_json(msg='Could not update protocolmappers for clientscope %s in realm %s: %s'
@@ -911,9 +1138,9 @@ class KeycloakAPI(object):
         """
         groups_url = URL_GROUPS.format(url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(groups_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(groups_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch list of groups in realm %s: %s"
                                       % (realm, str(e)))
@@ -929,9 +1156,9 @@ class KeycloakAPI(object):
         """
         groups_url = URL_GROUP.format(url=self.baseurl, realm=realm, groupid=gid)
         try:
-            return json.loads(to_native(open_url(groups_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(groups_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -977,7 +1204,7 @@ class KeycloakAPI(object):
         groups_url = URL_GROUPS.format(url=self.baseurl, realm=realm)
         try:
             return open_url(groups_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(grouprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(grouprep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg="Could not create group %s in realm %s: %s"
                                       % (grouprep['name'], realm, str(e)))
@@ -992,7 +1219,7 @@ class KeycloakAPI(object):
 
         try:
             return open_url(group_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(grouprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(grouprep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update group %s in realm %s: %s'
                                       % (grouprep['name'], realm, str(e)))
@@ -1041,9 +1268,9 @@ class KeycloakAPI(object):
         """
         rolelist_url = URL_REALM_ROLES.format(url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(rolelist_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(rolelist_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of roles for realm %s: %s'
                                       % (realm, str(e)))
@@ -1060,8 +1287,8 @@ class KeycloakAPI(object):
         """
         role_url = URL_REALM_ROLE.format(url=self.baseurl, realm=realm, name=quote(name))
         try:
-            return json.loads(to_native(open_url(role_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(role_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except HTTPError as e:
             if e.code == 404:
                 return None
@@ -1081,7 +1308,7 @@ class KeycloakAPI(object):
         roles_url = URL_REALM_ROLES.format(url=self.baseurl, realm=realm)
         try:
             return open_url(roles_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(rolerep), validate_certs=self.validate_certs)
+                            data=_json_dumps(rolerep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create role %s in realm %s: %s'
                                       % (rolerep['name'], realm, str(e)))
@@ -1095,7 +1322,7 @@ class KeycloakAPI(object):
         role_url = URL_REALM_ROLE.format(url=self.baseurl, realm=realm, name=quote(rolerep['name']))
         try:
             return open_url(role_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(rolerep), validate_certs=self.validate_certs)
+                            data=_json_dumps(rolerep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update role %s in realm %s: %s'
                                       % (rolerep['name'], realm, str(e)))
@@ -1127,9 +1354,9 @@ class KeycloakAPI(object):
                                       % (clientid, realm))
         rolelist_url = URL_CLIENT_ROLES.format(url=self.baseurl, realm=realm, id=cid)
         try:
-            return json.loads(to_native(open_url(rolelist_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(rolelist_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of roles for client %s in realm %s: %s'
                                       % (clientid, realm, str(e)))
@@ -1152,8 +1379,8 @@ class KeycloakAPI(object):
                                       % (clientid, realm))
         role_url = URL_CLIENT_ROLE.format(url=self.baseurl, realm=realm, id=cid, name=quote(name))
         try:
-            return json.loads(to_native(open_url(role_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(role_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except HTTPError as e:
             if e.code == 404:
                 return None
@@ -1179,7 +1406,7 @@ class KeycloakAPI(object):
         roles_url = URL_CLIENT_ROLES.format(url=self.baseurl, realm=realm, id=cid)
         try:
             return open_url(roles_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(rolerep), validate_certs=self.validate_certs)
+                            data=_json_dumps(rolerep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create role %s for client %s in realm %s: %s'
                                       % (rolerep['name'], clientid, realm, str(e)))
@@ -1199,7 +1426,7 @@ class KeycloakAPI(object):
         role_url = URL_CLIENT_ROLE.format(url=self.baseurl, realm=realm, id=cid, name=quote(rolerep['name']))
         try:
             return open_url(role_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(rolerep), validate_certs=self.validate_certs)
+                            data=_json_dumps(rolerep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update role %s for client %s in realm %s: %s'
                                       % (rolerep['name'], clientid, realm, str(e)))
@@ -1233,9 +1460,9 @@ class KeycloakAPI(object):
         try:
             authentication_flow = {}
             # Check if the authentication flow exists on the Keycloak serveraders
-            authentications = json.load(open_url(URL_AUTHENTICATION_FLOWS.format(url=self.baseurl, realm=realm), method='GET',
-                                                 http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout, validate_certs=self.validate_certs))
+            authentications = _json_load(open_url(URL_AUTHENTICATION_FLOWS.format(url=self.baseurl, realm=realm), method='GET',
+                                                  http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout, validate_certs=self.validate_certs))
             for authentication in authentications:
                 if authentication["alias"] == alias:
                     authentication_flow = authentication
@@ -1278,10 +1505,10 @@ class KeycloakAPI(object):
                     copyfrom=quote(config["copyFrom"])),
                 method='POST',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(new_name),
+                data=_json_dumps(new_name),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
-            flow_list = json.load(
+            flow_list = _json_load(
                 open_url(
                     URL_AUTHENTICATION_FLOWS.format(url=self.baseurl,
                                                     realm=realm),
@@ -1317,10 +1544,10 @@ class KeycloakAPI(object):
                     realm=realm),
                 method='POST',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(new_flow),
+                data=_json_dumps(new_flow),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
-            flow_list = json.load(
+            flow_list = _json_load(
                 open_url(
                     URL_AUTHENTICATION_FLOWS.format(
                         url=self.baseurl,
@@ -1352,7 +1579,7 @@ class KeycloakAPI(object):
                     flowalias=quote(flowAlias)),
                 method='PUT',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(updatedExec),
+                data=_json_dumps(updatedExec),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
         except Exception as e:
@@ -1373,7 +1600,7 @@ class KeycloakAPI(object):
                     id=executionId),
                 method='POST',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(authenticationConfig),
+                data=_json_dumps(authenticationConfig),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
         except Exception as e:
@@ -1398,7 +1625,7 @@ class KeycloakAPI(object):
                     flowalias=quote(flowAlias)),
                 method='POST',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(newSubFlow),
+                data=_json_dumps(newSubFlow),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
         except Exception as e:
@@ -1422,7 +1649,7 @@ class KeycloakAPI(object):
                     flowalias=quote(flowAlias)),
                 method='POST',
                 http_agent=self.http_agent, headers=self.restheaders,
-                data=json.dumps(newExec),
+                data=_json_dumps(newExec),
                 timeout=self.connection_timeout,
                 validate_certs=self.validate_certs)
         except Exception as e:
@@ -1471,7 +1698,7 @@ class KeycloakAPI(object):
         """
         try:
             # Get executions created
-            executions = json.load(
+            executions = _json_load(
                 open_url(
                     URL_AUTHENTICATION_FLOW_EXECUTIONS.format(
                         url=self.baseurl,
@@ -1484,7 +1711,7 @@ class KeycloakAPI(object):
             for execution in executions:
                 if "authenticationConfig" in execution:
                     execConfigId = execution["authenticationConfig"]
-                    execConfig = json.load(
+                    execConfig = _json_load(
                         open_url(
                             URL_AUTHENTICATION_CONFIG.format(
                                 url=self.baseurl,
@@ -1507,8 +1734,8 @@ class KeycloakAPI(object):
         """
         idps_url = URL_IDENTITY_PROVIDERS.format(url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(idps_url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(idps_url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of identity providers for realm %s: %s'
                                       % (realm, str(e)))
@@ -1524,8 +1751,8 @@ class KeycloakAPI(object):
         """
         idp_url = URL_IDENTITY_PROVIDER.format(url=self.baseurl, realm=realm, alias=alias)
         try:
-            return json.loads(to_native(open_url(idp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(idp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except HTTPError as e:
             if e.code == 404:
                 return None
@@ -1545,7 +1772,7 @@ class KeycloakAPI(object):
         idps_url = URL_IDENTITY_PROVIDERS.format(url=self.baseurl, realm=realm)
         try:
             return open_url(idps_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(idprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(idprep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create identity provider %s in realm %s: %s'
                                       % (idprep['alias'], realm, str(e)))
@@ -1559,7 +1786,7 @@ class KeycloakAPI(object):
         idp_url = URL_IDENTITY_PROVIDER.format(url=self.baseurl, realm=realm, alias=idprep['alias'])
         try:
             return open_url(idp_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(idprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(idprep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update identity provider %s in realm %s: %s'
                                       % (idprep['alias'], realm, str(e)))
@@ -1585,9 +1812,9 @@ class KeycloakAPI(object):
         """
         mappers_url = URL_IDENTITY_PROVIDER_MAPPERS.format(url=self.baseurl, realm=realm, alias=alias)
         try:
-            return json.loads(to_native(open_url(mappers_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(mappers_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of identity provider mappers for idp %s in realm %s: %s'
                                       % (alias, realm, str(e)))
@@ -1604,9 +1831,9 @@ class KeycloakAPI(object):
         """
         mapper_url = URL_IDENTITY_PROVIDER_MAPPER.format(url=self.baseurl, realm=realm, alias=alias, id=mid)
         try:
-            return json.loads(to_native(open_url(mapper_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(mapper_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except HTTPError as e:
             if e.code == 404:
                 return None
@@ -1627,7 +1854,7 @@ class KeycloakAPI(object):
         mappers_url = URL_IDENTITY_PROVIDER_MAPPERS.format(url=self.baseurl, realm=realm, alias=alias)
         try:
             return open_url(mappers_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(mapper), validate_certs=self.validate_certs)
+                            data=_json_dumps(mapper), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not create identity provider mapper %s for idp %s in realm %s: %s'
                                       % (mapper['name'], alias, realm, str(e)))
@@ -1642,7 +1869,7 @@ class KeycloakAPI(object):
         mapper_url = URL_IDENTITY_PROVIDER_MAPPER.format(url=self.baseurl, realm=realm, alias=alias, id=mapper['id'])
         try:
             return open_url(mapper_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(mapper), validate_certs=self.validate_certs)
+                            data=_json_dumps(mapper), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update mapper %s for identity provider %s in realm %s: %s'
                                       % (mapper['id'], alias, realm, str(e)))
@@ -1672,8 +1899,8 @@ class KeycloakAPI(object):
             comps_url += '?%s' % filter
 
         try:
-            return json.loads(to_native(open_url(comps_url, method='GET', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(comps_url, method='GET', http_agent=self.http_agent, headers=self.restheaders,
+                                                  timeout=self.connection_timeout, validate_certs=self.validate_certs).read()))
         except ValueError as e:
             self.module.fail_json(msg='API returned incorrect JSON when trying to obtain list of components for realm %s: %s'
                                       % (realm, str(e)))
@@ -1689,8 +1916,8 @@ class KeycloakAPI(object):
         """
         comp_url = URL_COMPONENT.format(url=self.baseurl, realm=realm, id=cid)
         try:
-            return json.loads(to_native(open_url(comp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(comp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except HTTPError as e:
             if e.code == 404:
                 return None
@@ -1710,13 +1937,13 @@ class KeycloakAPI(object):
         comps_url = URL_COMPONENTS.format(url=self.baseurl, realm=realm)
         try:
             resp = open_url(comps_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(comprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(comprep), validate_certs=self.validate_certs)
             comp_url = resp.getheader('Location')
             if comp_url is None:
                 self.module.fail_json(msg='Could not create component in realm %s: %s'
                                           % (realm, 'unexpected response'))
-            return json.loads(to_native(open_url(comp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(open_url(comp_url, method="GET", http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
+                                                  validate_certs=self.validate_certs).read()))
         except Exception as e:
             self.module.fail_json(msg='Could not create component in realm %s: %s'
                                       % (realm, str(e)))
@@ -1733,7 +1960,7 @@ class KeycloakAPI(object):
         comp_url = URL_COMPONENT.format(url=self.baseurl, realm=realm, id=cid)
         try:
             return open_url(comp_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(comprep), validate_certs=self.validate_certs)
+                            data=_json_dumps(comprep), validate_certs=self.validate_certs)
         except Exception as e:
             self.module.fail_json(msg='Could not update component %s in realm %s: %s'
                                       % (cid, realm, str(e)))
@@ -1761,9 +1988,7 @@ class KeycloakAPI(object):
         """
         users_url = URL_USERS.format(url=self.baseurl, realm=realm)
         try:
-            return json.loads(to_native(open_url(users_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(self._request(users_url, method='GET').read()))
         except Exception as e:
             self.module.fail_json(msg="Could not fetch list of users in realm %s: %s"
                                       % (realm, str(e)))
@@ -1779,9 +2004,7 @@ class KeycloakAPI(object):
         """
         user_url = URL_USER.format(url=self.baseurl, realm=realm, userid=uid)
         try:
-            return json.loads(to_native(open_url(user_url, method="GET", http_agent=self.http_agent, headers=self.restheaders,
-                                                 timeout=self.connection_timeout,
-                                                 validate_certs=self.validate_certs).read()))
+            return _json_loads(to_native(self._request(user_url, method='GET').read()))
 
         except HTTPError as e:
             if e.code == 404:
@@ -1793,31 +2016,144 @@ class KeycloakAPI(object):
             self.module.fail_json(msg="Could not fetch user %s in realm %s: %s"
                                       % (uid, realm, str(e)))
 
-    def get_user_by_name(self, name, realm="master"):
-        """ Fetch a keycloak group within a realm based on its name.
-
-        The Keycloak API does not allow filtering of the Groups resource by name.
-        As a result, this method first retrieves the entire list of groups - name and ID -
-        then performs a second query to fetch the group.
+    def get_user_count(self, realm="master"):
+        """ Fetch the number of users of a realm.
 
-        If the group does not exist, None is returned.
-        :param name: Name of the group to fetch.
-        :param realm: Realm in which the group resides; default 'master'
+        :param realm: Realm of the users (default "master").
         """
-        users_url = URL_USERS.format(url=self.baseurl, realm=realm)
+        count_url = URL_USERS_COUNT.format(url=self.baseurl, realm=realm)
         try:
-            all_users = self.get_users(realm=realm)
+            return int(to_native(self._request(count_url, method='GET').read()))
+        except Exception as e:
+            self.module.fail_json(msg="Could not count users in realm %s: %s"
+                                      % (realm, str(e)))
 
-            for user in all_users:
-                if user['username'] == name:
-                    return self.get_user_by_userid(user['id'], realm=realm)
+    def index_users_for_lookups(self, lookups, realm="master"):
+        """ Build the user index of a realm when it takes fewer requests than looking up users one by one.
 
-            return None
+        Looking up a user by name costs one request, indexing the realm one request per
+        USERS_PAGE_SIZE users, plus one request to count them.
+
+        :param lookups: Number of users of the realm about to be looked up by name.
+        :param realm: Realm of the users (default "master").
+        :return: True if the users of the realm are indexed.
+        """
+        with self._user_index_lock:
+            if realm in self._user_index:
+                return True
+        # counting the users and fetching a single page already takes two requests
+        if lookups <= 2:
+            return False
+        pages = -(-self.get_user_count(realm) // USERS_PAGE_SIZE)
+        if pages >= lookups:
+            return False
+        self.get_user_index(realm)
+        return True
+
+    def get_user_index(self, realm="master"):
+        """ Fetch the name and ID of all users of a realm and index the IDs by name.
+
+        The users are fetched page by page in their brief representation. Once built, the
+        index is used by the lookups of users by name and updated when users are created,
+        updated or deleted through this object. This is worth it when most users of the
+        realm are going to be looked up, see index_users_for_lookups.
+
+        :param realm: Realm to index (default "master").
+        :return: dict mapping user names to user IDs
+        """
+        with self._user_index_lock:
+            return self._get_user_index(realm)
+
+    def _get_user_index(self, realm):
+        if realm not in self._user_index:
+            users_url = URL_USERS.format(url=self.baseurl, realm=realm)
+            index = {}
+            first = 0
+            while True:
+                page_url = '%s?%s' % (users_url, urlencode(dict(briefRepresentation='true', first=first, max=USERS_PAGE_SIZE)))
+                try:
+                    page = _json_loads(to_native(self._request(page_url, method='GET').read()))
+                except Exception as e:
+                    self.module.fail_json(msg="Could not fetch list of users in realm %s: %s"
+                                              % (realm, str(e)))
+                for user in page:
+                    index[user['username']] = user['id']
+                if len(page) < USERS_PAGE_SIZE:
+                    break
+                first += len(page)
+            self._user_index[realm] = index
+            self._user_names[realm] = dict((userid, name) for name, userid in index.items())
+        return self._user_index[realm]
+
+    def _index_user(self, userid, name=None, realm="master"):
+        """ Update the user index of a realm, if it has been built, after a user has been written.
+
+        :param userid: ID of the user.
+        :param name: New name of the user, None if the user has been deleted.
+        :param realm: Realm in which the user resides.
+        """
+        with self._user_index_lock:
+            index = self._user_index.get(realm)
+            if index is None:
+                return
+            names = self._user_names[realm]
+            previous_name = names.pop(userid, None)
+            if previous_name is not None and index.get(previous_name) == userid:
+                del index[previous_name]
+            if name is not None:
+                index[name] = userid
+                names[userid] = name
+
+    def get_user_id_by_name(self, name, realm="master"):
+        """ Fetch the ID of a keycloak user within a realm based on its name.
+
+        When the users of the realm have been indexed (see index_users_for_lookups), the index
+        is used. Otherwise the brief representation of the user is queried with an exact
+        match on the name, limited to one result. Keycloak versions which do not support
+        exact matches return any user whose name contains the requested name; in that case
+        the matching users are scanned page by page until the user is found.
+
+        If the user does not exist, None is returned.
+        :param name: Name of the user.
+        :param realm: Realm in which the user resides; default 'master'
+        """
+        with self._user_index_lock:
+            index = self._user_index.get(realm)
+            if index is not None:
+                return index.get(name)
 
+        users_url = URL_USERS.format(url=self.baseurl, realm=realm)
+        query = dict(username=name, exact='true', briefRepresentation='true', first=0, max=1)
+        try:
+            while True:
+                page = _json_loads(to_native(self._request('%s?%s' % (users_url, urlencode(query)), method='GET').read()))
+                for user in page:
+                    if user['username'] == name:
+                        return user['id']
+                if len(page) < query['max']:
+                    return None
+                # the name matched other users, scan all the users matching it
+                query['first'] += len(page)
+                query['max'] = USERS_PAGE_SIZE
         except Exception as e:
             self.module.fail_json(msg="Could not fetch user %s in realm %s: %s"
                                       % (name, realm, str(e)))
 
+    def get_user_by_name(self, name, realm="master"):
+        """ Fetch a keycloak user within a realm based on its name.
+
+        The name is resolved to an ID (see get_user_id_by_name), then a second query
+        fetches the user.
+
+        If the user does not exist, None is returned.
+        :param name: Name of the user to fetch.
+        :param realm: Realm in which the user resides; default 'master'
+        """
+        uid = self.get_user_id_by_name(name, realm=realm)
+        if uid is None:
+            return None
+        return self.get_user_by_userid(uid, realm=realm)
+
     def create_user(self, userrep, realm="master"):
         """ Create a Keycloak User.
 
@@ -1827,12 +2163,20 @@ class KeycloakAPI(object):
         users_url = URL_USERS.format(url=self.baseurl, realm=realm)
 
         try:
-            return open_url(users_url, method='POST', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(userrep), validate_certs=self.validate_certs)
+            response = self._request(users_url, method='POST', data=_json_dumps(userrep))
         except Exception as e:
             self.module.fail_json(msg="Could not create user %s in realm %s: %s"
                                       % (userrep['username'], realm, str(e)))
 
+        location = response.getheader('Location')
+        if location:
+            self._index_user(location.rstrip('/').split('/')[-1], userrep['username'], realm=realm)
+        else:
+            with self._user_index_lock:
+                self._user_index.pop(realm, None)
+                self._user_names.pop(realm, None)
+        return response
+
     def update_user(self, userrep, realm="master"):
         """ Update an existing user.
 
@@ -1842,12 +2186,56 @@ class KeycloakAPI(object):
         user_url = URL_USER.format(url=self.baseurl, realm=realm, userid=userrep['id'])
 
         try:
-            return open_url(user_url, method='PUT', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            data=json.dumps(userrep), validate_certs=self.validate_certs)
+            response = self._request(user_url, method='PUT', data=_json_dumps(userrep))
         except Exception as e:
             self.module.fail_json(msg='Could not update user %s in realm %s: %s'
                                       % (userrep['username'], realm, str(e)))
 
+        if 'username' in userrep:
+            self._index_user(userrep['id'], userrep['username'], realm=realm)
+        return response
+
+    def update_user_partial(self, uid, userrep, realm="master"):
+        """ Update some fields of an existing user.
+
+        Keycloak only updates the fields present in the representation and keeps the
+        others, so only the changed fields need to be sent.
+
+        :param uid: ID of the user to update.
+        :param userrep: A partial UserRepresentation holding the fields to update.
+        :param realm: Realm in which the user resides; default 'master'.
+        :return HTTPResponse object on success
+        """
+        user_url = URL_USER.format(url=self.baseurl, realm=realm, userid=uid)
+
+        try:
+            response = self._request(user_url, method='PUT', data=_json_dumps(userrep))
+        except Exception as e:
+            self.module.fail_json(msg='Could not update user %s in realm %s: %s'
+                                      % (userrep.get('username', uid), realm, str(e)))
+
+        if 'username' in userrep:
+            self._index_user(uid, userrep['username'], realm=realm)
+        return response
+
+    def reset_user_password(self, uid, credential, realm="master"):
+        """ Set the password of an existing user.
+
+        This is lighter than updating the whole user when only its password changes.
+
+        :param uid: ID of the user.
+        :param credential: CredentialRepresentation of type password holding the new password.
+        :param realm: Realm in which the user resides; default 'master'.
+        :return HTTPResponse object on success
+        """
+        reset_url = URL_USER_RESET_PASSWORD.format(url=self.baseurl, realm=realm, userid=uid)
+
+        try:
+            return self._request(reset_url, method='PUT', data=_json_dumps(credential))
+        except Exception as e:
+            self.module.fail_json(msg='Could not reset password of user %s in realm %s: %s'
+                                      % (uid, realm, str(e)))
+
     def delete_user(self, name=None, userid=None, realm="master"):
         """ Delete a user. One of name or userid must be provided.
 
@@ -1867,10 +2255,7 @@ class KeycloakAPI(object):
         # in the case that both are provided, prefer the ID, since it's one
         # less lookup.
         if userid is None and name is not None:
-            for user in self.get_users(realm=realm):
-                if user['username'] == name:
-                    userid = user['id']
-                    break
+            userid = self.get_user_id_by_name(name, realm=realm)
 
         # if the user doesn't exist - no problem, nothing to delete.
         if userid is None:
@@ -1879,7 +2264,9 @@ class KeycloakAPI(object):
         # should have a good userid by here.
         user_url = URL_USER.format(realm=realm, userid=userid, url=self.baseurl)
         try:
-            return open_url(user_url, method='DELETE', http_agent=self.http_agent, headers=self.restheaders, timeout=self.connection_timeout,
-                            validate_certs=self.validate_certs)
+            response = self._request(user_url, method='DELETE')
         except Exception as e:
             self.module.fail_json(msg="Unable to delete user %s: %s" % (userid, str(e)))
+
+        self._index_user(userid, realm=realm)
+        return response
@@ -116,9 +116,140 @@ options:
             - A dict of key/value pairs to set as custom attributes for the user.
             - Values may be single values (e.g. a string) or a list of strings.
 
+    cache_token:
+        type: bool
+        description:
+            - Cache the access token obtained from I(auth_username) and I(auth_password) below C(~/.ansible/tmp)
+              and reuse it in subsequent invocations until it is about to expire.
+            - This avoids a login to Keycloak for every task when managing many users.
+            - The cache file is only readable by the user running the module, but it holds a valid bearer token.
+        default: false
+        version_added: 5.5.0
+
+    offline_check:
+        type: bool
+        description:
+            - In check mode, do not connect to Keycloak at all. The users are assumed not to exist, so the diff
+              shows the users as built from the module options only.
+            - This allows to validate the options of many users without any API call.
+            - Users with I(state=absent) are assumed to exist instead, and are reported as changed since their deletion
+              cannot be ruled out.
+            - Users given by I(id) only, without I(name), fail with I(state=present), because creating a user requires its name.
+            - Has no effect when not running in check mode.
+        default: false
+        version_added: 5.5.0
+
+    fetch_after_write:
+        type: bool
+        description:
+            - Fetch the user from Keycloak after creating or updating it to build I(end_state).
+            - When C(false), I(end_state) is built from the representation sent to Keycloak, using the
+              ID returned on creation. This saves one API call per change, but fields computed by
+              Keycloak (for example I(createdTimestamp) or I(access)) are not refreshed.
+        default: false
+        version_added: 5.5.0
+
+    users:
+        type: list
+        elements: dict
+        description:
+            - A list of users to manage in one module invocation, sharing the connection to Keycloak.
+            - This is much faster than looping over the module for many users.
+            - Every element accepts the user options of this module. I(state) and I(realm) default to the values of the
+              module options of the same name.
+            - Mutually exclusive with I(id) and I(name); the other user options of the module are ignored when I(users) is used.
+            - A user which cannot be managed does not stop the processing of the other users. The module fails once all
+              users are processed, reporting the outcome for every user in I(results).
+        version_added: 5.5.0
+        suboptions:
+            state:
+                description:
+                    - State of the user, see the I(state) option of the module.
+                    - Defaults to the value of the I(state) module option.
+                type: str
+                choices:
+                    - present
+                    - absent
+            realm:
+                description:
+                    - They Keycloak realm under which this user resides.
+                    - Defaults to the value of the I(realm) module option.
+                type: str
+            id:
+                description:
+                    - The unique identifier for this user.
+                    - One of I(id) and I(name) is required.
+                type: str
+            name:
+                description:
+                    - Name of the user.
+                    - One of I(id) and I(name) is required.
+                type: str
+            enabled:
+                description: whether the user is enabled or not
+                type: bool
+                default: true
+            first_name:
+                description:
+                    - First name of the user.
+                type: str
+            last_name:
+                description:
+                    - Last name of the user.
+                type: str
+            email:
+                description: Email for the user.
+                type: str
+            email_verified:
+                description: Set whether the email is verified or not.
+                type: bool
+                default: true
+            required_actions:
+                description: A list of actions that will be applied on the user
+                type: list
+                elements: str
+            attributes:
+                description:
+                    - A dict of key/value pairs to set as custom attributes for the user.
+                    - Values may be single values (e.g. a string) or a list of strings.
+                type: dict
+            credentials:
+                description: user credentials configuration.
+                type: list
+                elements: dict
+                suboptions:
+                    type:
+                        description:
+                            - Type of credential e.g password.
+                        type: str
+                    value:
+                        description:
+                            - Value of the credential.
+                        type: str
+                    userLabel:
+                        description:
+                            - User-defined Label for the credential.
+                        type: str
+                    temporary:
+                        description:
+                            - Whether the password is temporary or not.
+                        type: bool
+                        default: false
+
+    concurrency:
+        type: int
+        description:
+            - Number of users of I(users) processed in parallel.
+            - Must be between C(1) and C(32), to avoid overloading Keycloak.
+            - Users are processed one after the other when the Python C(concurrent.futures) library is not available.
+        default: 8
+        version_added: 5.5.0
+
 notes:
     - Presently, the I(realmRoles), I(clientRoles) and I(access) attributes returned by the Keycloak API
       are read-only for users. This limitation will be removed in a later version of this module.
+    - If the Python C(requests) library is installed, the connections to Keycloak are kept alive and reused
+      between the API calls of the module. Certificates are verified against the system trust store either way.
 
 author:
     - Dishant Pandya (@drpdishant)
@@ -224,6 +355,23 @@ EXAMPLES = """
       value:  holmes@sher.lock
       temporary: False
   delegate_to: localhost
+
+- name: Create or update many users in one task
+  community.general.keycloak_user:
+    realm: midgard
+    auth_client_id: admin-cli
+    auth_keycloak_url: https://auth.example.com/auth
+    auth_realm: master
+    auth_username: USERNAME
+    auth_password: PASSWORD
+    users:
+      - name: drstrange
+        first_name: Stephen
+      - name: wong
+        first_name: Wong
+      - name: kaecilius
+        state: absent
+  delegate_to: localhost
 """
 
 RETURN = """
@@ -233,7 +381,10 @@ msg:
     type: str
 
 end_state:
-    description: Representation of the user after module execution (sample is truncated).
+    description:
+      - Representation of the user after module execution (sample is truncated).
+      - After a creation, unless I(fetch_after_write=true), it is built from the representation sent to Keycloak
+        and the ID returned by Keycloak. Fields computed by Keycloak, like I(access) or I(createdTimestamp), are then missing.
     returned: on success
     type: dict
     contains:
@@ -258,21 +409,31 @@ end_state:
         attributes:
           description: Attributes applied to this user.
           type: dict
-          returned: always
+          returned: when the user is read back from Keycloak (it already existed, or I(fetch_after_write=true)), or I(attributes) is given
           sample:
             attr1: ["val1", "val2", "val3"]
         access:
           description: A dict describing the accesses you have to this user based on the credentials used.
           type: dict
-          returned: always
+          returned: when the user is read back from Keycloak (it already existed, or I(fetch_after_write=true))
           sample:
             manage: true
             manageMembership: true
             view: true
 
+results:
+    description:
+      - Results for each element of I(users), in the same order.
+      - Every result contains the I(msg), I(changed) and I(end_state) keys as returned when managing a single user.
+      - The result of a user which could not be managed has I(failed) set to C(true), and I(msg) describes the failure.
+    returned: when I(users) is used, also when the module fails
+    type: list
+    elements: dict
+    version_added: 5.5.0
+
 user:
   description:
-    - Representation of the user after module execution.
+    - Representation of the user after module execution, see I(end_state).
     - Deprecated return value, it will be removed in community.general 6.0.0. Please use the return value I(end_state) instead.
   returned: always
   type: dict
@@ -298,13 +459,13 @@ user:
     attributes:
       description: Attributes applied to this user.
       type: dict
-      returned: always
+      returned: when the user is read back from Keycloak (it already existed, or I(fetch_after_write=true)), or I(attributes) is given
       sample:
         attr1: ["val1", "val2", "val3"]
     access:
       description: A dict describing the accesses you have to this user based on the credentials used.
       type: dict
-      returned: always
+      returned: when the user is read back from Keycloak (it already existed, or I(fetch_after_write=true))
       sample:
         manage: true
         manageMembership: true
@@ -316,93 +477,147 @@ from ansible_collections.community.general.plugins.module_utils.identity.keycloa
     KeycloakAPI,
     camel,
     keycloak_argument_spec,
+    get_cached_token,
     get_token,
     KeycloakError,
 )
 from ansible.module_utils.basic import AnsibleModule
 
+from collections import Counter
 
-def main():
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_CONCURRENT_FUTURES = True
+except ImportError:
+    HAS_CONCURRENT_FUTURES = False
+
+MAX_CONCURRENCY = 32
+
+OFFLINE_CHECK_MSG = "offline check; Keycloak was not queried and the user is assumed not to exist."
+OFFLINE_CHECK_ABSENT_MSG = "offline check; Keycloak was not queried and the user is assumed to exist, it would be deleted."
+
+KEYCLOAK_ARGUMENT_SPEC = keycloak_argument_spec()
+
+# Module options which do not describe the user itself
+NON_USER_PARAMS = frozenset(KEYCLOAK_ARGUMENT_SPEC) | frozenset(
+    ["state", "realm", "cache_token", "offline_check", "fetch_after_write", "concurrency", "users"]
+)
+
+REQUIRED_ONE_OF = [
+    ["id", "name", "users"],
+    ["token", "auth_realm", "auth_username", "auth_password"],
+]
+REQUIRED_TOGETHER = [["auth_realm", "auth_username", "auth_password"]]
+MUTUALLY_EXCLUSIVE = [["id", "users"], ["name", "users"]]
+
+# Keycloak API field names of the user options
+USER_FIELDS = {
+    param: camel(param)
+    for param in ["id", "attributes", "email", "enabled", "first_name", "last_name", "required_actions", "credentials", "email_verified"]
+}
+USER_FIELDS.update(name="username", user_groups="groups")
+
+
+class UserFailure(Exception):
+    """Failure to ensure the state of a user"""
+
+
+class RaisingModule(object):
     """
-    Module execution
+    Proxy of an AnsibleModule whose fail_json raises UserFailure instead of exiting
 
-    :return:
+    fail_json prints the module result and exits the thread calling it. The users of a batch are
+    processed in worker threads, which must leave reporting the failure to the main thread.
     """
-    argument_spec = keycloak_argument_spec()
 
-    meta_args = dict(
-        state=dict(default="present", choices=["present", "absent"]),
-        realm=dict(default="master"),
-        id=dict(type="str"),
-        name=dict(type="str"),
-        attributes=dict(type="dict"),
-        email=dict(type="str"),
-        enabled=dict(type="bool", default=True),
-        first_name=dict(type="str"),
-        last_name=dict(type="str"),
-        required_actions=dict(type="list", elements="str"),
-        credentials=dict(
-            type="list",
-            elements="dict",
-            options=dict(
-                type=dict(type="str"),
-                value=dict(type="str", no_log=True),
-                temporary=dict(type="bool", default=False),
-                userLabel=dict(type="str"),
-            ),
-        ),
-        email_verified=dict(type="bool", default=True),
-    )
+    def __init__(self, module):
+        self._module = module
 
-    argument_spec.update(meta_args)
+    def __getattr__(self, name):
+        return getattr(self._module, name)
 
-    module = AnsibleModule(
-        argument_spec=argument_spec,
-        supports_check_mode=True,
-        required_one_of=(
-            [
-                ["id", "name"],
-                ["token", "auth_realm", "auth_username", "auth_password"],
-            ]
-        ),
-        required_together=([["auth_realm", "auth_username", "auth_password"]]),
-    )
+    def fail_json(self, msg, **kwargs):
+        raise UserFailure(msg)
 
-    result = dict(changed=False, msg="", diff={}, user="")
 
-    # Obtain access token, initialize API
-    try:
-        connection_header = get_token(module.params)
-    except KeycloakError as e:
-        module.fail_json(msg=str(e))
+def written_user(userrep):
+    """
+    Representation of a user as Keycloak stores it after writing userrep
 
-    kc = KeycloakAPI(module, connection_header)
+    Credentials are write-only in the Keycloak API and are never returned.
+
+    :param userrep: UserRepresentation sent to Keycloak
+    :return: UserRepresentation without credentials
+    """
+    return dict((k, v) for k, v in userrep.items() if k != "credentials")
 
-    realm = module.params.get("realm")
-    state = module.params.get("state")
-    uid = module.params.get("id")
-    username = module.params.get("name")
-    attributes = module.params.get("attributes")
+
+def process_user(module, kc, params):
+    """
+    Ensure the state of a single user
+
+    :param module: AnsibleModule instance
+    :param kc: KeycloakAPI instance, None for an offline check
+    :param params: options describing the user, in the form of the module options
+    :return: result dict for this user
+    :raises UserFailure: when the state of the user cannot be ensured
+    """
+    result = dict(changed=False, msg="", diff={}, user="")
+
+    realm = params.get("realm")
+    state = params.get("state")
+    fetch_after_write = module.params.get("fetch_after_write")
+    uid = params.get("id")
+    username = params.get("name")
+    attributes = params.get("attributes")
 
     # attributes in Keycloak have their values returned as lists
     # via the API. attributes is a dict, so we'll transparently convert
     # the values to lists.
     if attributes is not None:
-        for key, val in module.params["attributes"].items():
-            module.params["attributes"][key] = (
-                [val] if not isinstance(val, list) else val
-            )
+        params["attributes"] = {
+            key: val if isinstance(val, list) else [val]
+            for key, val in attributes.items()
+        }
 
     # Filter and map the parameters names that apply to the user
     user_params = [
         x
-        for x in module.params
-        if x not in list(keycloak_argument_spec().keys()) + ["state", "realm"]
-        and module.params.get(x) is not None
+        for x in params
+        if x not in NON_USER_PARAMS
+        and params.get(x) is not None
     ]
 
+    # Deleting a user by name only requires its ID, unless the representation is needed for the diff
+    if state == "absent" and uid is None and not module._diff and kc is not None:
+        uid = kc.get_user_id_by_name(username, realm=realm)
+        result["end_state"] = {}
+        result["user"] = result["end_state"]
+        if uid is None:
+            result["msg"] = "user does not exist; doing nothing."
+            return result
+
+        result["changed"] = True
+        if module.check_mode:
+            return result
+
+        kc.delete_user(userid=uid, realm=realm)
+        result["msg"] = "user {name} has been deleted".format(name=username)
+        return result
+
+    # Without querying Keycloak, the deletion of the user cannot be ruled out
+    if state == "absent" and kc is None:
+        result["changed"] = True
+        result["end_state"] = {}
+        result["user"] = result["end_state"]
+        result["msg"] = OFFLINE_CHECK_ABSENT_MSG
+        return result
+
     # See if it already exists in Keycloak
-    if uid is None:
+    if kc is None:
+        # offline check
+        before_user = None
+    elif uid is None:
         before_user = kc.get_user_by_name(username, realm=realm)
     else:
         before_user = kc.get_user_by_userid(uid, realm=realm)
@@ -411,21 +626,23 @@ def main():
         before_user = {}
 
     # Build a proposed changeset from parameters given to this module
-    changeset = {}
-
-    for param in user_params:
-        new_param_value = module.params.get(param)
-        old_value = before_user[param] if param in before_user else None
-        if param == "name":
-            changeset[camel("username")] = new_param_value
-        elif param == "user_groups":
-            changeset[camel("groups")] = new_param_value
-        elif new_param_value != old_value:
-            changeset[camel(param)] = new_param_value
-
-    # Prepare the desired values using the existing values (non-existence results in a dict that is save to use as a basis)
-    desired_user = before_user.copy()
-    desired_user.update(changeset)
+    new_items = {
+        USER_FIELDS.get(param) or camel(param): params[param]
+        for param in user_params
+    }
+    changeset = {
+        field: value
+        for field, value in new_items.items()
+        if before_user.get(field) != value
+    }
+
+    # Prepare the desired values using the existing values (non-existence results in a dict that is save to use as a basis).
+    # Without changes, or when deleting, the existing user is used as is instead of a copy.
+    if changeset and state == "present":
+        desired_user = before_user.copy()
+        desired_user.update(changeset)
+    else:
+        desired_user = before_user
 
     # Cater for when it doesn't exist (an empty dict)
     if not before_user:
@@ -437,22 +654,30 @@ def main():
             result["end_state"] = {}
             result["user"] = result["end_state"]
             result["msg"] = "user does not exist; doing nothing."
-            module.exit_json(**result)
+            return result
 
         # Process a creation
 
         if username is None:
-            module.fail_json(msg="name must be specified when creating a new user")
+            raise UserFailure("name must be specified when creating a new user")
 
         if module._diff:
             result["diff"] = dict(before="", after=desired_user)
 
         if module.check_mode:
-            module.exit_json(**result)
+            if kc is None:
+                result["msg"] = OFFLINE_CHECK_MSG
+            return result
 
         # create it
-        kc.create_user(desired_user, realm=realm)
-        after_user = kc.get_user_by_name(username, realm)
+        response = kc.create_user(desired_user, realm=realm)
+        location = response.getheader("Location") if response is not None else None
+        if fetch_after_write or not location:
+            after_user = kc.get_user_by_name(username, realm)
+        else:
+            # Keycloak answers with the URL of the new user, there is no need to fetch it back
+            after_user = written_user(desired_user)
+            after_user["id"] = location.rstrip("/").split("/")[-1]
         result["end_state"] = after_user
         result["user"] = result["end_state"]
 
@@ -460,21 +685,21 @@ def main():
             name=after_user["username"], id=after_user["id"]
         )
         result["changed"] = True
-        module.exit_json(**result)
+        return result
 
     else:
         if state == "present":
             # Process an update
 
             # no changes
-            if desired_user == before_user:
+            if not changeset:
                 result["changed"] = False
                 result["end_state"] = desired_user
                 result["user"] = result["end_state"]
                 result["msg"] = "No changes required to user {name}.".format(
                     name=before_user["username"]
                 )
-                module.exit_json(**result)
+                return result
 
             # doing an update
             result["changed"] = True
@@ -483,18 +708,32 @@ def main():
                 result["diff"] = dict(before=before_user, after=desired_user)
 
             if module.check_mode:
-                module.exit_json(**result)
-
-            # do the update
-            kc.update_user(desired_user, realm=realm)
-
-            after_user = kc.get_user_by_userid(desired_user["id"], realm=realm)
+                return result
+
+            if set(changeset) == {"credentials"} and all(cred.get("type") == "password" for cred in changeset["credentials"]):
+                # only the password changes, which does not require updating the user itself
+                for cred in changeset["credentials"]:
+                    kc.reset_user_password(
+                        before_user["id"],
+                        {key: value for key, value in cred.items() if value is not None},
+                        realm=realm,
+                    )
+            else:
+                # do the update, sending only the changed fields; Keycloak keeps the others
+                userrep = dict(changeset)
+                userrep.setdefault("username", before_user["username"])
+                kc.update_user_partial(before_user["id"], userrep, realm=realm)
+
+            if fetch_after_write:
+                after_user = kc.get_user_by_userid(desired_user["id"], realm=realm)
+            else:
+                after_user = written_user(desired_user)
 
             result["end_state"] = after_user
             result["user"] = result["end_state"]
 
             result["msg"] = "user {id} has been updated".format(id=after_user["id"])
-            module.exit_json(**result)
+            return result
 
         else:
             # Process a deletion (because state was not 'present')
@@ -504,7 +743,7 @@ def main():
                 result["diff"] = dict(before=before_user, after="")
 
             if module.check_mode:
-                module.exit_json(**result)
+                return result
 
             # delete it
             uid = before_user["id"]
@@ -517,6 +756,163 @@ def main():
                 name=before_user["username"]
             )
 
+    return result
+
+
+def process_batch_user(module, kc, params):
+    """
+    Ensure the state of a user of a batch, catching its failure
+
+    :param module: RaisingModule instance
+    :param kc: KeycloakAPI instance using module, None for an offline check
+    :param params: options describing the user, in the form of the module options
+    :return: result dict for this user, with the failed and msg keys set on failure
+    """
+    try:
+        return process_user(module, kc, params)
+    except UserFailure as e:
+        return dict(changed=False, failed=True, msg=str(e))
+
+
+def main():
+    """
+    Module execution
+
+    :return:
+    """
+    argument_spec = dict(KEYCLOAK_ARGUMENT_SPEC)
+
+    meta_args_single = dict(
+        id=dict(type="str"),
+        name=dict(type="str"),
+        attributes=dict(type="dict"),
+        email=dict(type="str"),
+        enabled=dict(type="bool", default=True),
+        first_name=dict(type="str"),
+        last_name=dict(type="str"),
+        required_actions=dict(type="list", elements="str"),
+        credentials=dict(
+            type="list",
+            elements="dict",
+            options=dict(
+                type=dict(type="str"),
+                value=dict(type="str", no_log=True),
+                temporary=dict(type="bool", default=False),
+                userLabel=dict(type="str"),
+            ),
+        ),
+        email_verified=dict(type="bool", default=True),
+    )
+
+    meta_args = dict(
+        state=dict(default="present", choices=["present", "absent"]),
+        realm=dict(default="master"),
+        cache_token=dict(type="bool", default=False),
+        offline_check=dict(type="bool", default=False),
+        fetch_after_write=dict(type="bool", default=False),
+        concurrency=dict(type="int", default=8),
+        users=dict(
+            type="list",
+            elements="dict",
+            options=dict(
+                meta_args_single,
+                state=dict(type="str", choices=["present", "absent"]),
+                realm=dict(type="str"),
+            ),
+            required_one_of=[["id", "name"]],
+        ),
+    )
+    meta_args.update(meta_args_single)
+
+    argument_spec.update(meta_args)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=REQUIRED_ONE_OF,
+        required_together=REQUIRED_TOGETHER,
+        mutually_exclusive=MUTUALLY_EXCLUSIVE,
+    )
+
+    if module.params.get("users") is not None:
+        # no thread processing the batch may exit the module, failures are reported once all users are processed
+        api_module = RaisingModule(module)
+    else:
+        api_module = module
+
+    if module.check_mode and module.params.get("offline_check"):
+        # Keycloak is not contacted at all, the users are assumed not to exist
+        kc = None
+    else:
+        # Obtain access token, initialize API
+        try:
+            if module.params.get("cache_token"):
+                connection_header = get_cached_token(module.params)
+            else:
+                connection_header = get_token(module.params)
+        except KeycloakError as e:
+            module.fail_json(msg=str(e))
+
+        kc = KeycloakAPI(api_module, connection_header)
+
+    if module.params.get("users") is None:
+        try:
+            result = process_user(module, kc, module.params)
+        except UserFailure as e:
+            module.fail_json(msg=str(e))
+        module.exit_json(**result)
+
+    concurrency = module.params.get("concurrency")
+    if not 1 <= concurrency <= MAX_CONCURRENCY:
+        module.fail_json(msg="concurrency must be between 1 and {max}".format(max=MAX_CONCURRENCY))
+
+    # Process a batch of users with one API connection; state and realm default to the module options
+    users = []
+    for user in module.params["users"]:
+        user = dict(user)
+        for option in ("state", "realm"):
+            if user.get(option) is None:
+                user[option] = module.params[option]
+        users.append(user)
+
+    if kc is not None:
+        # Resolving many names of a realm can take fewer requests through an index of its users
+        lookups = Counter(user["realm"] for user in users if user.get("id") is None)
+        try:
+            for realm, count in lookups.items():
+                kc.index_users_for_lookups(count, realm=realm)
+        except UserFailure as e:
+            module.fail_json(msg=str(e))
+
+    if concurrency > 1 and len(users) > 1 and HAS_CONCURRENT_FUTURES:
+        # The users are independent from each other, their API calls can be made in parallel
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        futures = [executor.submit(process_batch_user, api_module, kc, user) for user in users]
+        try:
+            results = [future.result() for future in futures]
+        except BaseException:
+            # an unexpected error, do not start processing more users
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+    else:
+        results = [process_batch_user(api_module, kc, user) for user in users]
+
+    # The users processed before a failure are kept in Keycloak, report what happened to every user
+    changed = len([r for r in results if r["changed"]])
+    failed = len([r for r in results if r.get("failed")])
+    result = dict(
+        changed=changed > 0,
+        msg="{count} users processed, {changed} changed".format(count=len(results), changed=changed),
+        results=results,
+    )
+    if module._diff:
+        result["diff"] = [r["diff"] for r in results if r.get("diff")]
+    if failed:
+        result["msg"] += ", {failed} failed".format(failed=failed)
+        module.fail_json(**result)
     module.exit_json(**result)
 
 
@@ -5,10 +5,15 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import base64
+import json
+import time
+
 import pytest
 from itertools import count
 
 from ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak import (
+    get_cached_token,
     get_token,
     KeycloakError,
 )
@@ -163,3 +168,64 @@ def test_json_without_token_returned(mock_json_without_token_returned):
         'Could not obtain access token from http://keycloak.url'
         '/auth/realms/master/protocol/openid-connect/token'
     )
+
+
+def build_jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode('utf-8')).decode('ascii').rstrip('=')
+    return 'header.%s.signature' % payload
+
+
+@pytest.fixture()
+def mock_jwt_connection(mocker):
+    token_response = {
+        'http://keycloak.url/auth/realms/master/protocol/openid-connect/token': create_wrapper(
+            json.dumps({'access_token': build_jwt(int(time.time()) + 300)})), }
+    return mocker.patch(
+        'ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak.open_url',
+        side_effect=build_mocked_request(count(), token_response),
+        autospec=True
+    )
+
+
+def test_cached_token_is_reused(mock_jwt_connection, tmpdir):
+    first_header = get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    second_header = get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    assert first_header == second_header
+    assert mock_jwt_connection.call_count == 1
+
+
+def test_expired_cached_token_is_renewed(mock_jwt_connection, tmpdir):
+    get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    for cache_file in tmpdir.listdir():
+        cached = json.loads(cache_file.read())
+        cache_file.write(json.dumps(dict(cached, access_token=build_jwt(int(time.time()) + 10))))
+    get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    assert mock_jwt_connection.call_count == 2
+
+
+def test_cached_token_is_not_reused_with_another_password(mock_jwt_connection, tmpdir):
+    get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    cache_files = tmpdir.listdir()
+    get_cached_token(dict(module_params_creds, auth_password='changed'), cache_dir=str(tmpdir))
+    assert mock_jwt_connection.call_count == 2
+    assert tmpdir.listdir() == cache_files
+    assert 'admin' not in cache_files[0].read()
+
+
+def test_stale_cached_token_is_removed(mock_jwt_connection, mocker, tmpdir):
+    get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    url = 'http://keycloak.url/auth/realms/master/protocol/openid-connect/token'
+    mocker.patch(
+        'ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak.open_url',
+        side_effect=build_mocked_request(count(), {url: raise_401(url)}),
+    )
+    with pytest.raises(KeycloakError):
+        get_cached_token(dict(module_params_creds, auth_password='wrong'), cache_dir=str(tmpdir))
+    assert tmpdir.listdir() == []
+
+
+def test_cached_token_is_not_shared_between_users(mock_jwt_connection, tmpdir):
+    get_cached_token(module_params_creds, cache_dir=str(tmpdir))
+    other_user = dict(module_params_creds, auth_username='other')
+    get_cached_token(other_user, cache_dir=str(tmpdir))
+    assert mock_jwt_connection.call_count == 2
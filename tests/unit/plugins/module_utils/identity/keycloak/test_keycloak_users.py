@@ -0,0 +1,215 @@
+# Copyright (c) Ansible Project
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+
+import pytest
+
+from ansible_collections.community.general.tests.unit.compat.mock import MagicMock
+from ansible_collections.community.general.plugins.module_utils.identity.keycloak import keycloak
+from ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak import KeycloakAPI
+from ansible.module_utils.six import StringIO
+from ansible.module_utils.six.moves.urllib.parse import parse_qs, urlparse
+
+USERS_URL = 'http://keycloak.url/auth/admin/realms/myrealm/users'
+
+
+class FakeKeycloak(object):
+    """Minimal in-memory implementation of the Keycloak users endpoints, used in place of open_url"""
+
+    def __init__(self, users, supports_exact=True):
+        self.users = dict((user['id'], user) for user in users)
+        self.supports_exact = supports_exact
+        self.requests = []
+
+    def __call__(self, url, method=None, data=None, **kwargs):
+        self.requests.append((method, url))
+        parsed = urlparse(url)
+        query = dict((k, v[0]) for k, v in parse_qs(parsed.query).items())
+        path = '%s://%s%s' % (parsed.scheme, parsed.netloc, parsed.path)
+        if path == USERS_URL and method == 'GET':
+            users = sorted(self.users.values(), key=lambda user: user['username'])
+            if 'username' in query and self.supports_exact and query.get('exact') == 'true':
+                users = [user for user in users if query['username'] == user['username']]
+            elif 'username' in query:
+                users = [user for user in users if query['username'] in user['username']]
+            first = int(query.get('first', 0))
+            users = users[first:first + int(query.get('max', 100))]
+            return StringIO(json.dumps([dict(id=user['id'], username=user['username']) for user in users]))
+        if path == USERS_URL + '/count' and method == 'GET':
+            return StringIO(str(len(self.users)))
+        if path.startswith(USERS_URL + '/') and method == 'GET':
+            return StringIO(json.dumps(self.users[path.split('/')[-1]]))
+        if path == USERS_URL and method == 'POST':
+            user = json.loads(data)
+            user['id'] = 'id-%s' % user['username']
+            self.users[user['id']] = user
+            response = MagicMock()
+            response.getheader.return_value = '%s/%s' % (USERS_URL, user['id'])
+            return response
+        if path.startswith(USERS_URL + '/') and method == 'DELETE':
+            del self.users[path.split('/')[-1]]
+            return MagicMock()
+        raise AssertionError('Unexpected request %s %s' % (method, url))
+
+
+@pytest.fixture()
+def fake_keycloak(mocker):
+    fake = FakeKeycloak([dict(id='id-user%04d' % i, username='user%04d' % i) for i in range(2500)])
+    mocker.patch(
+        'ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak.open_url',
+        side_effect=fake,
+    )
+    return fake
+
+
+@pytest.fixture()
+def kc(mocker):
+    mocker.patch.object(keycloak, 'HAS_REQUESTS', False)
+    module = MagicMock()
+    module.params = {
+        'auth_keycloak_url': 'http://keycloak.url/auth',
+        'validate_certs': True,
+        'connection_timeout': 10,
+        'http_agent': 'Ansible',
+    }
+    return KeycloakAPI(module, {'Authorization': 'Bearer alongtoken'})
+
+
+def api_with_session(mocker, validate_certs, cafile=None, capath=None):
+    mocker.patch.object(keycloak, 'HAS_REQUESTS', True)
+    mocker.patch.object(keycloak.ssl, 'get_default_verify_paths', return_value=MagicMock(cafile=cafile, capath=capath))
+    module = MagicMock()
+    module.params = {
+        'auth_keycloak_url': 'http://keycloak.url/auth',
+        'validate_certs': validate_certs,
+        'connection_timeout': 10,
+        'http_agent': 'Ansible',
+    }
+    return KeycloakAPI(module, {'Authorization': 'Bearer alongtoken'})
+
+
+@pytest.mark.skipif(not keycloak.HAS_REQUESTS, reason='requests is not installed')
+def test_session_verifies_against_system_trust_store(mocker):
+    assert api_with_session(mocker, True, cafile='/etc/ssl/cert.pem')._get_session().verify == '/etc/ssl/cert.pem'
+    assert api_with_session(mocker, True, capath='/etc/ssl/certs')._get_session().verify == '/etc/ssl/certs'
+    assert api_with_session(mocker, False, cafile='/etc/ssl/cert.pem')._get_session().verify is False
+
+
+@pytest.mark.skipif(not keycloak.HAS_REQUESTS, reason='requests is not installed')
+def test_no_session_without_system_trust_store(mocker):
+    assert api_with_session(mocker, True)._get_session() is None
+    assert api_with_session(mocker, False)._get_session().verify is False
+
+
+@pytest.mark.parametrize('has_orjson', [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(not keycloak.HAS_ORJSON, reason='orjson is not installed')),
+])
+def test_json_dumps_like_json(mocker, has_orjson):
+    mocker.patch.object(keycloak, 'HAS_ORJSON', has_orjson)
+    assert json.loads(keycloak._json_dumps({1: 'a'})) == {'1': 'a'}
+    assert json.loads(keycloak._json_dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+
+
+def count_list_requests(fake):
+    return len([url for method, url in fake.requests if method == 'GET' and url.startswith(USERS_URL + '?')])
+
+
+def test_get_user_by_name_queries_one_user(fake_keycloak, kc):
+    assert kc.get_user_by_name('user0001', realm='myrealm')['id'] == 'id-user0001'
+    assert kc.get_user_by_name('nobody', realm='myrealm') is None
+    assert count_list_requests(fake_keycloak) == 2
+    assert 'max=1' in fake_keycloak.requests[0][1]
+
+
+def test_get_user_by_name_without_exact_support(mocker, kc):
+    users = [dict(id='id-user%04d' % i, username='user%04d' % i) for i in range(2500)]
+    users.append(dict(id='id-auser0001', username='auser0001'))
+    fake = FakeKeycloak(users, supports_exact=False)
+    mocker.patch(
+        'ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak.open_url',
+        side_effect=fake,
+    )
+    assert kc.get_user_by_name('user0001', realm='myrealm')['id'] == 'id-user0001'
+    assert kc.get_user_by_name('user00', realm='myrealm') is None
+    assert count_list_requests(fake) == 2 + 2
+
+
+def test_get_user_by_name_uses_index(fake_keycloak, kc):
+    kc.get_user_index(realm='myrealm')
+    assert count_list_requests(fake_keycloak) == -(-2500 // keycloak.USERS_PAGE_SIZE)
+    assert kc.get_user_by_name('user0001', realm='myrealm')['id'] == 'id-user0001'
+    assert kc.get_user_by_name('user2499', realm='myrealm')['id'] == 'id-user2499'
+    assert kc.get_user_by_name('nobody', realm='myrealm') is None
+    assert count_list_requests(fake_keycloak) == -(-2500 // keycloak.USERS_PAGE_SIZE)
+
+
+def test_user_index_follows_writes(fake_keycloak, kc):
+    kc.get_user_index(realm='myrealm')
+    assert kc.get_user_by_name('newuser', realm='myrealm') is None
+    kc.create_user({'username': 'newuser'}, realm='myrealm')
+    assert kc.get_user_by_name('newuser', realm='myrealm')['id'] == 'id-newuser'
+    kc.delete_user(name='newuser', realm='myrealm')
+    assert kc.get_user_by_name('newuser', realm='myrealm') is None
+    assert count_list_requests(fake_keycloak) == -(-2500 // keycloak.USERS_PAGE_SIZE)
+
+
+def test_user_index_follows_renames(fake_keycloak, kc):
+    kc.get_user_index(realm='myrealm')
+    kc._index_user('id-user0001', 'renamed', realm='myrealm')
+    assert kc.get_user_id_by_name('renamed', realm='myrealm') == 'id-user0001'
+    assert kc.get_user_id_by_name('user0001', realm='myrealm') is None
+    kc._index_user('id-user0001', realm='myrealm')
+    assert kc.get_user_id_by_name('renamed', realm='myrealm') is None
+    assert count_list_requests(fake_keycloak) == -(-2500 // keycloak.USERS_PAGE_SIZE)
+
+
+def test_index_users_for_lookups(fake_keycloak, kc):
+    pages = -(-2500 // keycloak.USERS_PAGE_SIZE)
+    assert kc.index_users_for_lookups(2, realm='myrealm') is False
+    assert not fake_keycloak.requests
+    assert kc.index_users_for_lookups(pages, realm='myrealm') is False
+    assert count_list_requests(fake_keycloak) == 0
+    assert kc.index_users_for_lookups(pages + 1, realm='myrealm') is True
+    assert count_list_requests(fake_keycloak) == pages
+    assert kc.index_users_for_lookups(pages + 1, realm='myrealm') is True
+    assert len(fake_keycloak.requests) == 2 + pages
+    assert kc.get_user_id_by_name('user0001', realm='myrealm') == 'id-user0001'
+    assert count_list_requests(fake_keycloak) == pages
+
+
+def test_get_user_id_by_name(fake_keycloak, kc):
+    assert kc.get_user_id_by_name('user0001', realm='myrealm') == 'id-user0001'
+    assert kc.get_user_id_by_name('user00', realm='myrealm') is None
+    assert count_list_requests(fake_keycloak) == 2
+    assert 'briefRepresentation=true' in fake_keycloak.requests[0][1]
+    assert not [url for method, url in fake_keycloak.requests if not url.startswith(USERS_URL + '?')]
+
+
+@pytest.mark.skipif(not keycloak.HAS_REQUESTS, reason='requests is not installed')
+def test_user_requests_share_session():
+    module = MagicMock()
+    module.params = {
+        'auth_keycloak_url': 'http://keycloak.url/auth',
+        'validate_certs': False,
+        'connection_timeout': 10,
+        'http_agent': 'Ansible',
+    }
+    kc = KeycloakAPI(module, {'Authorization': 'Bearer alongtoken'})
+    responses = {
+        USERS_URL + '/id-user0001': MagicMock(status_code=200, content=b'{"id": "id-user0001", "username": "user0001"}'),
+        USERS_URL + '/id-unknown': MagicMock(status_code=404, reason='Not Found', content=b''),
+    }
+    session = kc._get_session()
+    session.request = MagicMock(side_effect=lambda method, url, **kwargs: responses[url])
+
+    assert kc.get_user_by_userid('id-user0001', realm='myrealm')['username'] == 'user0001'
+    assert kc.get_user_by_userid('id-unknown', realm='myrealm') is None
+    assert session.verify is False
+    assert session.headers['Authorization'] == 'Bearer alongtoken'
+    assert session.request.call_count == 2
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022, Ansible Project
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import threading
+from contextlib import contextmanager
+
+from ansible_collections.community.general.tests.unit.compat import unittest
+from ansible_collections.community.general.tests.unit.compat.mock import MagicMock, call, patch
+from ansible_collections.community.general.tests.unit.plugins.modules.utils import AnsibleExitJson, AnsibleFailJson, ModuleTestCase, set_module_args
+
+from ansible_collections.community.general.plugins.modules.identity.keycloak import keycloak_user
+
+from itertools import count
+
+from ansible.module_utils import basic
+from ansible.module_utils.six import StringIO
+
+
+@contextmanager
+def patch_keycloak_api(get_user_by_name=None, get_user_by_userid=None, get_user_id_by_name=None, create_user=None, update_user_partial=None,
+                       reset_user_password=None, delete_user=None, index_users_for_lookups=None):
+    """Mock context manager for patching the methods in KeycloakAPI that contact the Keycloak server
+
+    Patches the user related methods; the keyword arguments are used as side effects of the
+    corresponding mock objects.
+    """
+
+    obj = keycloak_user.KeycloakAPI
+    with patch.object(obj, 'get_user_by_name', side_effect=get_user_by_name) as mock_get_user_by_name:
+        with patch.object(obj, 'get_user_by_userid', side_effect=get_user_by_userid) as mock_get_user_by_userid:
+            with patch.object(obj, 'get_user_id_by_name', side_effect=get_user_id_by_name) as mock_get_user_id_by_name:
+                with patch.object(obj, 'create_user', side_effect=create_user) as mock_create_user:
+                    with patch.object(obj, 'update_user_partial', side_effect=update_user_partial) as mock_update_user_partial:
+                        with patch.object(obj, 'reset_user_password', side_effect=reset_user_password) as mock_reset_user_password:
+                            with patch.object(obj, 'delete_user', side_effect=delete_user) as mock_delete_user:
+                                with patch.object(obj, 'index_users_for_lookups', side_effect=index_users_for_lookups) as mock_index_users_for_lookups:
+                                    yield dict(
+                                        get_user_by_name=mock_get_user_by_name,
+                                        get_user_by_userid=mock_get_user_by_userid,
+                                        get_user_id_by_name=mock_get_user_id_by_name,
+                                        create_user=mock_create_user,
+                                        update_user_partial=mock_update_user_partial,
+                                        reset_user_password=mock_reset_user_password,
+                                        delete_user=mock_delete_user,
+                                        index_users_for_lookups=mock_index_users_for_lookups,
+                                    )
+
+
+def get_response(object_with_future_response, method, get_id_call_count):
+    if callable(object_with_future_response):
+        return object_with_future_response()
+    if isinstance(object_with_future_response, dict):
+        return get_response(
+            object_with_future_response[method], method, get_id_call_count)
+    if isinstance(object_with_future_response, list):
+        call_number = next(get_id_call_count)
+        return get_response(
+            object_with_future_response[call_number], method, get_id_call_count)
+    return object_with_future_response
+
+
+def build_mocked_request(get_id_user_count, response_dict):
+    def _mocked_requests(*args, **kwargs):
+        url = args[0]
+        method = kwargs['method']
+        future_response = response_dict.get(url, None)
+        return get_response(future_response, method, get_id_user_count)
+    return _mocked_requests
+
+
+def create_wrapper(text_as_string):
+    """Allow to mock many times a call to one address.
+    Without this function, the StringIO is empty for the second call.
+    """
+    def _create_wrapper():
+        return StringIO(text_as_string)
+    return _create_wrapper
+
+
+def mock_good_connection():
+    token_response = {
+        'http://keycloak.url/auth/realms/master/protocol/openid-connect/token': create_wrapper('{"access_token": "alongtoken"}'), }
+    return patch(
+        'ansible_collections.community.general.plugins.module_utils.identity.keycloak.keycloak.open_url',
+        side_effect=build_mocked_request(count(), token_response),
+        autospec=True
+    )
+
+
+def created_response(uid):
+    response = MagicMock()
+    response.getheader.return_value = 'http://keycloak.url/auth/admin/realms/realm-name/users/%s' % uid
+    return response
+
+
+AUTH_ARGS = {
+    'auth_keycloak_url': 'http://keycloak.url/auth',
+    'auth_password': 'admin',
+    'auth_realm': 'master',
+    'auth_username': 'admin',
+    'auth_client_id': 'admin-cli',
+    'validate_certs': True,
+}
+
+EXISTING_USER = {
+    'id': '9d59aa76-2755-48c6-b1af-beb70a82c3cd',
+    'username': 'drstrange',
+    'firstName': 'Stephen',
+    'enabled': True,
+    'emailVerified': True,
+    'attributes': {'universe': ['marvel']},
+}
+
+
+class TestKeycloakUser(ModuleTestCase):
+    def setUp(self):
+        super(TestKeycloakUser, self).setUp()
+        self.module = keycloak_user
+
+    def run_module(self, module_args, **api_side_effects):
+        set_module_args(dict(AUTH_ARGS, **module_args))
+        with mock_good_connection():
+            with patch_keycloak_api(**api_side_effects) as mocks:
+                with self.assertRaises(AnsibleExitJson) as exec_info:
+                    self.module.main()
+        return exec_info.exception.args[0], mocks
+
+    def test_create_when_absent(self):
+        """Create a new user without fetching it back"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'first_name': 'Stephen',
+             'credentials': [{'type': 'password', 'value': 'secret'}]},
+            get_user_by_name=[None],
+            create_user=[created_response(EXISTING_USER['id'])],
+        )
+
+        self.assertEqual(len(mocks['get_user_by_name'].mock_calls), 1)
+        self.assertEqual(len(mocks['create_user'].mock_calls), 1)
+        self.assertIs(result['changed'], True)
+        self.assertEqual(result['end_state']['id'], EXISTING_USER['id'])
+        self.assertEqual(result['end_state']['firstName'], 'Stephen')
+        self.assertNotIn('credentials', result['end_state'])
+
+    def test_create_when_absent_fetch_after_write(self):
+        """Create a new user and fetch it back"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'first_name': 'Stephen', 'fetch_after_write': True},
+            get_user_by_name=[None, EXISTING_USER],
+            create_user=[created_response(EXISTING_USER['id'])],
+        )
+
+        self.assertEqual(len(mocks['get_user_by_name'].mock_calls), 2)
+        self.assertEqual(len(mocks['create_user'].mock_calls), 1)
+        self.assertIs(result['changed'], True)
+        self.assertEqual(result['end_state'], EXISTING_USER)
+
+    def test_update_when_present_with_change(self):
+        """Update an existing user without fetching it back"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'id': EXISTING_USER['id'], 'first_name': 'Steve'},
+            get_user_by_userid=[EXISTING_USER],
+            update_user_partial=[None],
+        )
+
+        self.assertEqual(len(mocks['get_user_by_userid'].mock_calls), 1)
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 1)
+        uid, userrep = mocks['update_user_partial'].mock_calls[0][1]
+        self.assertEqual(uid, EXISTING_USER['id'])
+        self.assertEqual(userrep, {'firstName': 'Steve', 'username': 'drstrange'})
+        self.assertIs(result['changed'], True)
+        self.assertEqual(result['end_state']['firstName'], 'Steve')
+
+    def test_update_password_only(self):
+        """Change only the password of an existing user"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'first_name': 'Stephen',
+             'credentials': [{'type': 'password', 'value': 'secret'}]},
+            get_user_by_name=[EXISTING_USER],
+            reset_user_password=[None],
+        )
+
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 0)
+        self.assertEqual(len(mocks['reset_user_password'].mock_calls), 1)
+        uid, credential = mocks['reset_user_password'].mock_calls[0][1]
+        self.assertEqual(uid, EXISTING_USER['id'])
+        self.assertEqual(credential, {'type': 'password', 'value': 'secret', 'temporary': False})
+        self.assertIs(result['changed'], True)
+
+    def test_update_password_and_other_fields(self):
+        """Change the password together with other fields of an existing user"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'first_name': 'Steve',
+             'credentials': [{'type': 'password', 'value': 'secret'}]},
+            get_user_by_name=[EXISTING_USER],
+            update_user_partial=[None],
+        )
+
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 1)
+        self.assertEqual(len(mocks['reset_user_password'].mock_calls), 0)
+        self.assertIs(result['changed'], True)
+
+    def test_update_when_present_no_change(self):
+        """Update an existing user without any change"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'first_name': 'Stephen', 'attributes': {'universe': 'marvel'}},
+            get_user_by_name=[EXISTING_USER],
+        )
+
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 0)
+        self.assertIs(result['changed'], False)
+
+    def test_delete_when_present(self):
+        """Delete an existing user, only looking up its ID"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'state': 'absent'},
+            get_user_id_by_name=[EXISTING_USER['id']],
+            delete_user=[None],
+        )
+
+        self.assertEqual(len(mocks['get_user_by_name'].mock_calls), 0)
+        self.assertEqual(len(mocks['delete_user'].mock_calls), 1)
+        self.assertEqual(mocks['delete_user'].mock_calls[0][2]['userid'], EXISTING_USER['id'])
+        self.assertIs(result['changed'], True)
+
+    def test_delete_when_present_with_diff(self):
+        """Delete an existing user, fetching it for the diff"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'state': 'absent', '_ansible_diff': True},
+            get_user_by_name=[EXISTING_USER],
+            delete_user=[None],
+        )
+
+        self.assertEqual(len(mocks['get_user_id_by_name'].mock_calls), 0)
+        self.assertEqual(len(mocks['delete_user'].mock_calls), 1)
+        self.assertEqual(result['diff']['before'], EXISTING_USER)
+        self.assertIs(result['changed'], True)
+
+    def test_delete_when_absent(self):
+        """Delete a user which does not exist"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'name': 'drstrange', 'state': 'absent'},
+            get_user_id_by_name=[None],
+        )
+
+        self.assertEqual(len(mocks['delete_user'].mock_calls), 0)
+        self.assertIs(result['changed'], False)
+
+    def test_batch(self):
+        """Create, update and delete users in one invocation"""
+
+        existing_wong = dict(EXISTING_USER, id='c6a4bd5c-6d6b-4e0a-a3e6-2b1f7f5c1a3e', username='wong', firstName='Wong')
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'concurrency': 1, 'users': [
+                {'name': 'drstrange', 'first_name': 'Stephen'},
+                {'name': 'wong', 'first_name': 'Wong', 'attributes': {'universe': 'marvel'}},
+                {'name': 'kaecilius', 'state': 'absent', 'realm': 'other-realm'},
+            ]},
+            get_user_by_name=[None, existing_wong],
+            get_user_id_by_name=[None],
+            create_user=[created_response(EXISTING_USER['id'])],
+        )
+
+        self.assertEqual(sorted(mocks['index_users_for_lookups'].mock_calls), [call(1, realm='other-realm'), call(2, realm='realm-name')])
+        self.assertEqual(len(mocks['get_user_by_name'].mock_calls), 2)
+        self.assertEqual(mocks['get_user_id_by_name'].mock_calls[0][2]['realm'], 'other-realm')
+        self.assertEqual(len(mocks['create_user'].mock_calls), 1)
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 0)
+        self.assertEqual(len(mocks['delete_user'].mock_calls), 0)
+        self.assertIs(result['changed'], True)
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, False])
+        self.assertEqual(result['results'][0]['end_state']['id'], EXISTING_USER['id'])
+
+    def test_batch_failure(self):
+        """Report the outcome of every user when one of them fails"""
+
+        set_module_args(dict(AUTH_ARGS, realm='realm-name', concurrency=1, users=[
+            {'name': 'drstrange', 'first_name': 'Stephen'},
+            {'id': 'id-nobody'},
+            {'name': 'wong', 'state': 'absent'},
+        ]))
+        with mock_good_connection():
+            with patch_keycloak_api(get_user_by_name=[None], get_user_by_userid=[None], get_user_id_by_name=['id-wong'],
+                                    create_user=[created_response(EXISTING_USER['id'])], delete_user=[None]) as mocks:
+                with self.assertRaises(AnsibleFailJson) as exec_info:
+                    self.module.main()
+
+        result = exec_info.exception.args[0]
+        self.assertEqual(len(mocks['create_user'].mock_calls), 1)
+        self.assertEqual(len(mocks['delete_user'].mock_calls), 1)
+        self.assertIs(result['changed'], True)
+        self.assertEqual(result['msg'], '3 users processed, 2 changed, 1 failed')
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True])
+        self.assertEqual([r.get('failed', False) for r in result['results']], [False, True, False])
+        self.assertEqual(result['results'][1]['msg'], 'name must be specified when creating a new user')
+
+    def test_batch_no_change(self):
+        """Batch invocation without any change"""
+
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'users': [{'id': EXISTING_USER['id'], 'first_name': 'Stephen'}]},
+            get_user_by_userid=[EXISTING_USER],
+        )
+
+        self.assertEqual(len(mocks['update_user_partial'].mock_calls), 0)
+        self.assertIs(result['changed'], False)
+        self.assertEqual(len(result['results']), 1)
+
+    def test_batch_concurrent(self):
+        """Process users of a batch in parallel, keeping the order of the results"""
+
+        names = ['user%02d' % i for i in range(20)]
+        existing = dict((name, dict(EXISTING_USER, id='id-%s' % name, username=name)) for name in names[::2])
+        result, mocks = self.run_module(
+            {'realm': 'realm-name', 'concurrency': 4, 'users': [{'name': name, 'first_name': 'Stephen'} for name in names]},
+            get_user_by_name=lambda name, realm: existing.get(name),
+            create_user=lambda userrep, realm: created_response('id-%s' % userrep['username']),
+        )
+
+        self.assertEqual(mocks['index_users_for_lookups'].mock_calls, [call(20, realm='realm-name')])
+        self.assertEqual(len(mocks['get_user_by_name'].mock_calls), 20)
+        self.assertEqual(len(mocks['create_user'].mock_calls), 10)
+        self.assertEqual([r['end_state']['username'] for r in result['results']], names)
+        self.assertEqual([r['changed'] for r in result['results']], [False, True] * 10)
+
+    def test_batch_concurrency_out_of_bounds(self):
+        """Refuse an unreasonable concurrency"""
+
+        set_module_args(dict(AUTH_ARGS, users=[{'name': 'drstrange'}], concurrency=100))
+        with mock_good_connection():
+            with patch_keycloak_api():
+                with self.assertRaises(AnsibleFailJson) as exec_info:
+                    self.module.main()
+
+        self.assertIn('concurrency', exec_info.exception.args[0]['msg'])
+
+    def test_batch_concurrent_failures(self):
+        """Report the failures of users processed in parallel once, from the main thread"""
+
+        failing_threads = []
+
+        def fail_json(**kwargs):
+            failing_threads.append(threading.current_thread())
+            raise AnsibleFailJson(dict(kwargs, failed=True))
+
+        set_module_args(dict(AUTH_ARGS, realm='realm-name', concurrency=4,
+                             users=[{'id': 'id-user%02d' % i} for i in range(4)] + [{'name': 'drstrange'}]))
+        with mock_good_connection():
+            with patch_keycloak_api(get_user_by_userid=lambda uid, realm: None, get_user_by_name=lambda name, realm: EXISTING_USER):
+                with patch.object(basic.AnsibleModule, 'fail_json', side_effect=fail_json):
+                    with self.assertRaises(AnsibleFailJson) as exec_info:
+                        self.module.main()
+
+        result = exec_info.exception.args[0]
+        self.assertEqual(failing_threads, [threading.current_thread()])
+        self.assertIs(result['changed'], False)
+        self.assertEqual([r.get('failed', False) for r in result['results']], [True] * 4 + [False])
+        self.assertEqual(result['results'][0]['msg'], 'name must be specified when creating a new user')
+
+    def test_offline_check(self):
+        """Check mode without connecting to Keycloak"""
+
+        set_module_args(dict(AUTH_ARGS, realm='realm-name', name='drstrange', first_name='Stephen', offline_check=True,
+                             _ansible_check_mode=True, _ansible_diff=True))
+        with mock_good_connection() as mock_open_url:
+            with patch_keycloak_api() as mocks:
+                with self.assertRaises(AnsibleExitJson) as exec_info:
+                    self.module.main()
+
+        result = exec_info.exception.args[0]
+        self.assertEqual(len(mock_open_url.mock_calls), 0)
+        self.assertFalse([name for name, mock in mocks.items() if mock.mock_calls])
+        self.assertEqual(result['diff']['before'], '')
+        self.assertEqual(result['diff']['after']['username'], 'drstrange')
+        self.assertEqual(result['diff']['after']['firstName'], 'Stephen')
+
+    def test_offline_check_absent(self):
+        """Report the possible deletion of users without connecting to Keycloak"""
+
+        set_module_args(dict(AUTH_ARGS, realm='realm-name', offline_check=True, _ansible_check_mode=True, users=[
+            {'name': 'drstrange', 'state': 'absent'},
+            {'id': EXISTING_USER['id'], 'state': 'absent'},
+            {'name': 'wong'},
+        ]))
+        with mock_good_connection() as mock_open_url:
+            with patch_keycloak_api() as mocks:
+                with self.assertRaises(AnsibleExitJson) as exec_info:
+                    self.module.main()
+
+        result = exec_info.exception.args[0]
+        self.assertEqual(len(mock_open_url.mock_calls), 0)
+        self.assertFalse([name for name, mock in mocks.items() if mock.mock_calls])
+        self.assertIs(result['changed'], True)
+        self.assertEqual([r['changed'] for r in result['results']], [True, True, False])
+        self.assertEqual([r['msg'] for r in result['results']], [keycloak_user.OFFLINE_CHECK_ABSENT_MSG] * 2 + [keycloak_user.OFFLINE_CHECK_MSG])
+
+
+if __name__ == '__main__':
+    unittest.main()